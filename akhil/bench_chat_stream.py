@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for /chat/stream request coalescing
+
+Fires many concurrent callers asking a handful of questions (with different
+casing and punctuation) at a local server backed by a mock upstream, once
+with coalescing off and once with it on, and reports upstream calls and
+latency for each run. Requires httpx (pip install httpx).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import httpx
+import uvicorn
+import main
+from config import Config
+from tenants import RateLimiter, registry
+
+QUESTIONS = [
+    "Tell me about the RV400",
+    "What is the battery warranty?",
+    "How do I book a test ride?",
+    "How long does charging take?",
+    "Which cities is Revolt available in?",
+]
+
+class MockUpstream:
+    """Stands in for GeminiLiveClient with a fixed reply and counts upstream calls"""
+    calls = 0
+
+    def __init__(self, chunks: int, chunk_delay: float):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+
+    async def start_conversation(self) -> str:
+        return "Conversation started"
+
+    async def send_text_message(self, text: str):
+        MockUpstream.calls += 1
+        for i in range(self.chunks):
+            await asyncio.sleep(self.chunk_delay)
+            yield f"chunk {i} "
+
+    def end_conversation(self):
+        pass
+
+def variant(question: str, i: int) -> str:
+    """Vary casing and punctuation the way real callers do"""
+    return [question, question.lower(), question.upper().rstrip("?"), f"  {question}!! "][i % 4]
+
+async def ask(client: httpx.AsyncClient, message: str) -> tuple:
+    """Stream one answer and return (latency, reply text)"""
+    start = time.perf_counter()
+    text = ""
+    async with client.stream("GET", "/chat/stream", params={"message": message}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event = json.loads(line[len("data: "):])
+                text += event.get("text", "")
+    return time.perf_counter() - start, text
+
+async def run_round(base_url: str, callers: int, questions: int, chunks: int, coalescing: bool) -> dict:
+    Config.CHAT_COALESCING_ENABLED = coalescing
+    MockUpstream.calls = 0
+    limits = httpx.Limits(max_connections=callers, max_keepalive_connections=callers)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        results = await asyncio.gather(*(
+            ask(client, variant(QUESTIONS[i % questions], i // questions)) for i in range(callers)
+        ))
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "coalescing": coalescing,
+        "requests": callers,
+        "upstream_calls": MockUpstream.calls,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "complete": sum(1 for _, text in results if text.count("chunk ") == chunks),
+    }
+
+async def run(args):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    main.client_factory = lambda tenant: MockUpstream(args.chunks, args.chunk_delay)
+    # The benchmark measures coalescing, so the /chat/stream rate limit is lifted
+    for tenant in registry.tenants.values():
+        tenant.chat_rate_limiter = RateLimiter(0)
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    try:
+        rounds = [
+            await run_round(f"http://127.0.0.1:{args.port}", args.callers, args.questions, args.chunks, coalescing)
+            for coalescing in (False, True)
+        ]
+    finally:
+        server.should_exit = True
+        await server_task
+
+    print(f"\n{args.callers} concurrent callers, {args.questions} distinct questions")
+    print(f"{'coalescing':>10}  {'requests':>8}  {'upstream':>8}  {'complete':>8}  {'p50':>8}  {'p95':>8}")
+    for r in rounds:
+        print(f"{'on' if r['coalescing'] else 'off':>10}  {r['requests']:>8}  {r['upstream_calls']:>8}  "
+              f"{r['complete']:>8}  {r['p50'] * 1000:>6.0f}ms  {r['p95'] * 1000:>6.0f}ms")
+
+    off, on = rounds
+    reduction = 1 - on["upstream_calls"] / off["upstream_calls"]
+    print(f"\n✅ Upstream calls reduced by {reduction:.0%} ({off['upstream_calls']} -> {on['upstream_calls']})")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark /chat/stream request coalescing")
+    parser.add_argument("--callers", type=int, default=200, help="Concurrent requests per round")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS), help="Distinct questions asked")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks in each mock reply")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between mock chunks")
+    parser.add_argument("--port", type=int, default=8766, help="Port for the local benchmark server")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main_cli()
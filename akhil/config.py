@@ -11,7 +11,59 @@ class Config:
     # Alternative models for development/testing:
     # MODEL_NAME = "gemini-1.5-pro"
     # MODEL_NAME = "gemini-1.0-pro"
-    
+
+    # Upstream deadlines (seconds) applied to every streamed turn
+    FIRST_TOKEN_TIMEOUT = float(os.getenv("FIRST_TOKEN_TIMEOUT", "15"))
+    INTER_TOKEN_TIMEOUT = float(os.getenv("INTER_TOKEN_TIMEOUT", "10"))
+
+    # Hedged requests: if the first token is slower than the recent p95,
+    # send the same turn again and stream whichever attempt answers first
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "2.0"))  # Used until enough samples are collected
+    HEDGE_MIN_SAMPLES = 20
+    HEDGE_SAMPLE_WINDOW = 200
+
+    # Opt-in session recording for offline replay (see recorder.py and replay.py)
+    RECORDING_ENABLED = os.getenv("RECORDING_ENABLED", "false").lower() == "true"
+    RECORDING_DIR = os.getenv("RECORDING_DIR", "recordings")
+    RECORDING_FLUSH_INTERVAL = float(os.getenv("RECORDING_FLUSH_INTERVAL", "1.0"))
+
+    # Admin endpoints (/admin/*) are disabled unless a token is set
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+    PROFILE_MAX_SECONDS = 60
+
+    # Turns slower than this (seconds) are kept with stage timings and task stacks
+    SLOW_TURN_THRESHOLD = float(os.getenv("SLOW_TURN_THRESHOLD", "3.0"))
+    SLOW_TURN_HISTORY = 50
+
+    # Per-session outbound queue (frames). Above the high watermark text chunks are
+    # coalesced; clients behind for OUTBOUND_SLOW_TIMEOUT seconds are degraded, then dropped
+    OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "256"))
+    OUTBOUND_HIGH_WATERMARK = int(os.getenv("OUTBOUND_HIGH_WATERMARK", "32"))
+    OUTBOUND_LOW_WATERMARK = int(os.getenv("OUTBOUND_LOW_WATERMARK", "8"))
+    OUTBOUND_SLOW_TIMEOUT = float(os.getenv("OUTBOUND_SLOW_TIMEOUT", "10"))
+
+    # Extra branded assistants are defined in TENANTS_FILE (see tenants.example.json);
+    # the built-in "Rev" assistant below is always available as DEFAULT_TENANT
+    TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+    DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "rev")
+
+    # Share one upstream reply between identical questions in flight on /chat/stream
+    CHAT_COALESCING_ENABLED = os.getenv("CHAT_COALESCING_ENABLED", "true").lower() == "true"
+    # /chat/stream is unauthenticated, so questions are bounded and each tenant gets a
+    # per-minute limit for it (tenants can override it with "chat_turns_per_minute")
+    CHAT_MAX_MESSAGE_CHARS = int(os.getenv("CHAT_MAX_MESSAGE_CHARS", "500"))
+    CHAT_TURNS_PER_MINUTE = int(os.getenv("CHAT_TURNS_PER_MINUTE", "60"))
+
+    # Speculative replies for streamed audio (audio_chunk/audio_end messages). Set a local
+    # recognizer as "module:Class", e.g. "speculation:StubRecognizer"; unset disables speculation
+    SPECULATIVE_RECOGNIZER = os.getenv("SPECULATIVE_RECOGNIZER", "")
+    SPECULATION_STABLE_CHUNKS = int(os.getenv("SPECULATION_STABLE_CHUNKS", "2"))
+    SPECULATION_MIN_WORDS = int(os.getenv("SPECULATION_MIN_WORDS", "3"))
+    # Bounds on one streamed utterance, which is buffered until audio_end
+    STREAMED_AUDIO_MAX_BYTES = int(os.getenv("STREAMED_AUDIO_MAX_BYTES", str(16 * 1024 * 1024)))
+    STREAMED_AUDIO_MAX_CHUNKS = int(os.getenv("STREAMED_AUDIO_MAX_CHUNKS", "2400"))
+
     # Real Revolt Motors data for accurate responses
     REVOLT_DATA = {
         "company": {
@@ -4,24 +4,36 @@ import logging
 from typing import AsyncGenerator, Optional
 import google.generativeai as genai
 from config import Config
+from tenants import Tenant, registry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _hedge_delay(latencies) -> float:
+    """Return the recent p95 time-to-first-token, or the configured default until enough samples exist"""
+    if len(latencies) < Config.HEDGE_MIN_SAMPLES:
+        return Config.HEDGE_DELAY
+    samples = sorted(latencies)
+    return samples[int(0.95 * (len(samples) - 1))]
+
 class GeminiLiveClient:
-    def __init__(self):
-        if not Config.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY environment variable is required")
-        
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(Config.MODEL_NAME)
+    def __init__(self, tenant: Optional[Tenant] = None, model=None):
+        self.tenant = tenant or registry.default
+        if model is None:
+            if not Config.GEMINI_API_KEY:
+                raise ValueError("GEMINI_API_KEY environment variable is required")
+
+            genai.configure(api_key=Config.GEMINI_API_KEY)
+            model = self.tenant.model
+        # Replay passes a recorded model here so the real client runs against it
+        self.model = model
         self.conversation = None
         
     async def start_conversation(self) -> str:
         """Start a new conversation session"""
         try:
-            # Initialize the conversation
-            self.conversation = self.model.start_chat()
+            # Initialize the conversation with the tenant's system instructions
+            self.conversation = self.model.start_chat(history=list(self.tenant.prompt_history))
             logger.info("Conversation started successfully")
             return "Conversation started"
         except Exception as e:
@@ -32,8 +44,6 @@ class GeminiLiveClient:
         """Send audio message and get streaming response"""
         if not self.conversation:
             await self.start_conversation()
-            # Send system instructions as first message
-            await self._send_system_instructions()
         
         try:
             # Create the audio part for the message
@@ -42,46 +52,116 @@ class GeminiLiveClient:
                 "data": audio_data
             }
             
-            # Send the audio message and get streaming response
-            response = await self.conversation.send_message_async(
-                audio_part,
-                stream=True
-            )
-            
-            # Stream the response chunks
-            async for chunk in response:
-                if chunk.text:
-                    yield chunk.text
+            # Send the audio message and stream the response chunks
+            async for text in self._stream_response(audio_part):
+                yield text
                     
         except Exception as e:
             logger.error(f"Error in send_audio_message: {e}")
             yield f"Error: {str(e)}"
     
-    async def _send_system_instructions(self):
-        """Send system instructions to set the AI's behavior"""
-        try:
-            # Send system instructions as a text message
-            async for _ in self.send_text_message(Config.SYSTEM_INSTRUCTIONS):
-                pass
-        except Exception as e:
-            logger.warning(f"Could not send system instructions: {e}")
-    
-    async def send_text_message(self, text: str) -> AsyncGenerator[str, None]:
-        """Send text message and get streaming response (for testing)"""
+    async def stream_text_message(self, text: str) -> AsyncGenerator[str, None]:
+        """Send text message and stream the response, raising upstream errors to the caller"""
         if not self.conversation:
             await self.start_conversation()
         
+        async for chunk in self._stream_response(text):
+            yield chunk
+    
+    async def send_text_message(self, text: str) -> AsyncGenerator[str, None]:
+        """Send text message and get streaming response (for testing)"""
         try:
-            response = await self.conversation.send_message_async(text, stream=True)
-            
-            async for chunk in response:
-                if chunk.text:
-                    yield chunk.text
+            async for chunk in self.stream_text_message(text):
+                yield chunk
                     
         except Exception as e:
             logger.error(f"Error in send_text_message: {e}")
             yield f"Error: {str(e)}"
     
+    async def _open_stream(self, chat, content):
+        """Send content on chat and wait for the first chunk of the reply"""
+        response = await chat.send_message_async(content, stream=True)
+        stream = response.__aiter__()
+        try:
+            first_chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        return chat, stream, first_chunk
+
+    async def _close_attempt(self, attempt):
+        """Close the stream of an attempt that lost the race"""
+        _, stream, _ = attempt
+        try:
+            await stream.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing hedged request: {e}")
+
+    async def _stream_response(self, content) -> AsyncGenerator[str, None]:
+        """Stream a reply under first-token and inter-token deadlines, hedging slow starts.
+
+        Each attempt runs on its own copy of the chat history so a cancelled or
+        stalled attempt never leaves a half-finished turn in the conversation;
+        the winning chat replaces ``self.conversation`` once its reply completes.
+        """
+        loop = asyncio.get_running_loop()
+        history = list(self.conversation.history if self.conversation else self.tenant.prompt_history)
+        started = loop.time()
+        deadline = started + Config.FIRST_TOKEN_TIMEOUT
+        hedge_at = started + _hedge_delay(self.tenant.first_token_latencies) if Config.HEDGE_ENABLED else None
+
+        attempts = {asyncio.ensure_future(self._open_stream(self.model.start_chat(history=history), content))}
+        winner = None
+        last_error = None
+        try:
+            while winner is None:
+                now = loop.time()
+                if now >= deadline:
+                    raise asyncio.TimeoutError(f"No response from model within {Config.FIRST_TOKEN_TIMEOUT}s")
+
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, attempts = await asyncio.wait(
+                    attempts, timeout=max(0.0, wake_at - now), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        # Another attempt answered in the same step; only one reply is streamed
+                        await self._close_attempt(task.result())
+
+                if winner is None and not attempts:
+                    raise last_error
+                if winner is None and hedge_at is not None and loop.time() >= hedge_at:
+                    logger.info(f"No first token after {hedge_at - started:.2f}s, sending hedged request")
+                    attempts.add(asyncio.ensure_future(self._open_stream(self.model.start_chat(history=history), content)))
+                    hedge_at = None
+        finally:
+            for task in attempts:
+                task.cancel()
+
+        self.tenant.first_token_latencies.append(loop.time() - started)
+        chat, stream, chunk = winner
+        while chunk is not None:
+            if chunk.text:
+                yield chunk.text
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), Config.INTER_TOKEN_TIMEOUT)
+            except StopAsyncIteration:
+                chunk = None
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError(f"Model stream stalled for more than {Config.INTER_TOKEN_TIMEOUT}s")
+
+        self.conversation = chat
+
+    def fork(self) -> "GeminiLiveClient":
+        """Return a client that continues from a copy of this conversation"""
+        client = GeminiLiveClient(self.tenant, self.model)
+        history = self.conversation.history if self.conversation else self.tenant.prompt_history
+        client.conversation = self.model.start_chat(history=list(history))
+        return client
+
     def end_conversation(self):
         """End the current conversation"""
         self.conversation = None
@@ -1,11 +1,21 @@
 import asyncio
 import json
 import logging
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from typing import Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 import aiofiles
+from config import Config
 from gemini_client import GeminiLiveClient
+from tenants import Tenant, registry
+from recorder import SessionRecorder
+from outbound import OutboundQueue
+from singleflight import SingleFlight, normalize_question
+import speculation
+from speculation import Speculator, load_recognizer
+import profiler
+from profiler import TurnTimer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +28,13 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Store active connections
 active_connections: dict[str, WebSocket] = {}
 gemini_clients: dict[str, GeminiLiveClient] = {}
+outbound_queues: dict[str, OutboundQueue] = {}
+
+# Builds the upstream client for each connection; replay.py swaps in a recorded upstream
+client_factory = GeminiLiveClient
+
+# Identical in-flight questions on /chat/stream share one upstream reply
+chat_flights = SingleFlight()
 
 @app.get("/", response_class=HTMLResponse)
 async def get_index():
@@ -33,28 +50,70 @@ async def get_debug():
         content = await f.read()
     return HTMLResponse(content=content)
 
+@app.websocket("/ws/{tenant_id}/{client_id}")
+async def tenant_websocket_endpoint(websocket: WebSocket, tenant_id: str, client_id: str):
+    """WebSocket endpoint for a specific branded assistant"""
+    await websocket_endpoint(websocket, client_id, tenant_id)
+
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
+async def websocket_endpoint(websocket: WebSocket, client_id: str, tenant_id: Optional[str] = None):
     """WebSocket endpoint for real-time voice chat"""
-    await websocket.accept()
-    active_connections[client_id] = websocket
+    # The tenant comes from the URL path, then the X-Tenant header, then the default
+    tenant = registry.resolve(tenant_id or websocket.headers.get("x-tenant"))
+    if tenant is None:
+        logger.warning(f"Rejected client {client_id}: unknown tenant")
+        await websocket.close(code=1008)
+        return
+    if not tenant.has_capacity():
+        logger.warning(f"Rejected client {client_id}: tenant {tenant.tenant_id} is at its session limit")
+        await websocket.close(code=1013)
+        return
+
+    # Reserve the slot before the first await so concurrent connects cannot overshoot max_sessions.
+    # Everything after it runs inside the try so the slot is given back if session setup fails
+    tenant.active_sessions += 1
+    speculator = None
+    recorder = None
+    outbound = None
     
     try:
+        await websocket.accept()
+        active_connections[client_id] = websocket
+        recorder = SessionRecorder(client_id, tenant.tenant_id, tenant.model_name) if Config.RECORDING_ENABLED else None
+        outbound = outbound_queues[client_id] = OutboundQueue(websocket, client_id, recorder)
+        
         # Initialize Gemini client for this connection
-        gemini_clients[client_id] = GeminiLiveClient()
+        gemini_clients[client_id] = client_factory(tenant)
         await gemini_clients[client_id].start_conversation()
+        speculator = Speculator(gemini_clients[client_id], load_recognizer(), client_id, tenant.rate_limiter)
         
-        logger.info(f"Client {client_id} connected")
+        logger.info(f"Client {client_id} connected to {tenant.tenant_id}")
         
         while True:
+            timer = None
+            message_type = None
+            error = None
             try:
                 # Receive message from client
                 data = await websocket.receive_text()
-                message = json.loads(data)
+                timer = TurnTimer(client_id, outbound.writer_task)
+                if recorder:
+                    await recorder.inbound(data)
+                with timer.stage("parse"):
+                    message = json.loads(data)
                 
                 message_type = message.get("type")
                 
-                if message_type == "audio":
+                if message_type in ("audio", "audio_end", "text") and not tenant.rate_limiter.allow():
+                    if message_type == "audio_end":
+                        # The rejected utterance must not carry over into the next one
+                        await speculator.reset()
+                    await outbound.put({
+                        "type": "error",
+                        "message": "Too many requests, please try again shortly"
+                    })
+                
+                elif message_type == "audio":
                     # Handle audio message
                     audio_data = message.get("audio_data")
                     mime_type = message.get("mime_type", "audio/webm")
@@ -62,64 +121,225 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     if audio_data:
                         # Convert base64 to bytes
                         import base64
-                        audio_bytes = base64.b64decode(audio_data)
+                        with timer.stage("decode"):
+                            audio_bytes = base64.b64decode(audio_data)
                         
-                        # Send to Gemini and stream response
-                        async for chunk in gemini_clients[client_id].send_audio_message(audio_bytes, mime_type):
-                            await websocket.send_text(json.dumps({
-                                "type": "response_chunk",
-                                "text": chunk
-                            }))
+                        # Send to Gemini and stream response. A speculative reply forked before
+                        # this turn would drop it from the conversation, so it is discarded
+                        speculator.discard()
+                        upstream = gemini_clients[client_id].send_audio_message(audio_bytes, mime_type)
+                        if recorder:
+                            upstream = recorder.track_upstream(upstream, "audio")
+                        async for chunk in timer.track(upstream, "upstream"):
+                            with timer.stage("enqueue"):
+                                await outbound.put({
+                                    "type": "response_chunk",
+                                    "text": chunk
+                                })
                         
                         # Send end of response marker
-                        await websocket.send_text(json.dumps({
+                        await outbound.put({
                             "type": "response_end"
-                        }))
+                        })
+                
+                elif message_type == "audio_chunk":
+                    # Part of a streamed recording, transcribed as it arrives
+                    audio_data = message.get("audio_data")
+                    if audio_data:
+                        import base64
+                        with timer.stage("decode"):
+                            chunk_bytes = base64.b64decode(audio_data)
+                        await speculator.feed(chunk_bytes)
+                
+                elif message_type == "audio_end":
+                    # End of a streamed recording: commit the speculative reply or answer the final transcript
+                    upstream = speculator.finish(message.get("mime_type", "audio/webm"))
+                    if recorder:
+                        upstream = recorder.track_upstream(upstream, "audio_stream")
+                    async for chunk in timer.track(upstream, "upstream"):
+                        with timer.stage("enqueue"):
+                            await outbound.put({
+                                "type": "response_chunk",
+                                "text": chunk
+                            })
+                    gemini_clients[client_id] = speculator.client
+                    
+                    await outbound.put({
+                        "type": "response_end"
+                    })
                 
                 elif message_type == "text":
                     # Handle text message (for testing)
                     text = message.get("text", "")
                     
-                    async for chunk in gemini_clients[client_id].send_text_message(text):
-                        await websocket.send_text(json.dumps({
-                            "type": "response_chunk",
-                            "text": chunk
-                        }))
+                    speculator.discard()
+                    upstream = gemini_clients[client_id].send_text_message(text)
+                    if recorder:
+                        upstream = recorder.track_upstream(upstream, "text")
+                    async for chunk in timer.track(upstream, "upstream"):
+                        with timer.stage("enqueue"):
+                            await outbound.put({
+                                "type": "response_chunk",
+                                "text": chunk
+                            })
                     
-                    await websocket.send_text(json.dumps({
+                    await outbound.put({
                         "type": "response_end"
-                    }))
+                    })
                 
                 elif message_type == "ping":
                     # Handle ping for connection health
-                    await websocket.send_text(json.dumps({
+                    await outbound.put({
                         "type": "pong"
-                    }))
+                    })
                     
-            except WebSocketDisconnect:
+            except WebSocketDisconnect as e:
+                error = e
                 break
             except Exception as e:
+                error = e
                 logger.error(f"Error processing message: {e}")
-                await websocket.send_text(json.dumps({
+                await outbound.put({
                     "type": "error",
                     "message": str(e)
-                }))
+                })
+            finally:
+                # Failed and disconnected turns are timed too, and the watchdog never outlives its turn
+                if timer:
+                    timer.finish(message_type, error)
                 
     except Exception as e:
         logger.error(f"WebSocket error for client {client_id}: {e}")
+        try:
+            # Session setup failed after accepting, so close rather than leave the client waiting
+            await websocket.close(code=1011)
+        except Exception:
+            pass
     finally:
         # Cleanup
-        if client_id in active_connections:
+        tenant.active_sessions -= 1
+        if speculator:
+            speculator.close()
+        if active_connections.get(client_id) is websocket:
             del active_connections[client_id]
         if client_id in gemini_clients:
             gemini_clients[client_id].end_conversation()
             del gemini_clients[client_id]
+        if outbound:
+            await outbound.close()
+            if outbound_queues.get(client_id) is outbound:
+                del outbound_queues[client_id]
+        if recorder:
+            await recorder.close()
         logger.info(f"Client {client_id} disconnected")
 
+async def stateless_reply(tenant: Tenant, message: str):
+    """Answer a single question on a fresh conversation"""
+    client = client_factory(tenant)
+    try:
+        # Start from the tenant's prompt so the endpoint answers as its assistant only
+        await client.start_conversation()
+        async for chunk in client.send_text_message(message):
+            yield chunk
+    finally:
+        client.end_conversation()
+
+def allow_chat(tenant: Tenant) -> bool:
+    """Charge one /chat/stream upstream call against the tenant's chat and turn limits"""
+    return tenant.chat_rate_limiter.allow() and tenant.rate_limiter.allow()
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.get("/chat/stream")
+async def chat_stream(message: str, tenant_id: Optional[str] = None, x_tenant: Optional[str] = Header(None)):
+    """Stateless text chat streamed as server-sent events"""
+    tenant = registry.resolve(tenant_id or x_tenant)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="Unknown tenant")
+    if not message.strip():
+        raise HTTPException(status_code=400, detail="message must not be empty")
+    if len(message) > Config.CHAT_MAX_MESSAGE_CHARS:
+        raise HTTPException(status_code=400, detail=f"message must be at most {Config.CHAT_MAX_MESSAGE_CHARS} characters")
+
+    if Config.CHAT_COALESCING_ENABLED:
+        key = (tenant.tenant_id, normalize_question(message))
+        # Callers joining an in-flight reply cost no upstream call, so only new flights are rate limited
+        reply = chat_flights.stream(key, lambda: stateless_reply(tenant, message), admit=lambda: allow_chat(tenant))
+        if reply is None:
+            raise HTTPException(status_code=429, detail="Too many requests, please try again shortly")
+    else:
+        if not allow_chat(tenant):
+            raise HTTPException(status_code=429, detail="Too many requests, please try again shortly")
+        reply = stateless_reply(tenant, message)
+
+    async def events():
+        try:
+            async for chunk in reply:
+                yield sse_event({"type": "response_chunk", "text": chunk})
+            yield sse_event({"type": "response_end"})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {e}")
+            yield sse_event({"type": "error", "message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "active_connections": len(active_connections)}
+    return {
+        "status": "healthy",
+        "active_connections": len(active_connections),
+        "tenants": {tenant_id: tenant.active_sessions for tenant_id, tenant in registry.tenants.items()},
+    }
+
+def check_admin_token(token: Optional[str]):
+    """Reject admin requests unless ADMIN_TOKEN is configured and matches"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if token != Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(seconds: float = 10.0, interval: float = 0.01, x_admin_token: Optional[str] = Header(None)):
+    """Sample the server for a number of seconds and return folded stacks for a flamegraph"""
+    check_admin_token(x_admin_token)
+    if not 0 < seconds <= Config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {Config.PROFILE_MAX_SECONDS}")
+    if interval < 0.001:
+        raise HTTPException(status_code=400, detail="interval must be at least 0.001")
+    try:
+        return await profiler.profile(seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/admin/slow-turns")
+async def admin_slow_turns(x_admin_token: Optional[str] = Header(None)):
+    """Return stage timings and task stacks of recent slow turns"""
+    check_admin_token(x_admin_token)
+    return {"threshold_seconds": Config.SLOW_TURN_THRESHOLD, "turns": list(profiler.slow_turns)}
+
+@app.get("/admin/outbound")
+async def admin_outbound(x_admin_token: Optional[str] = Header(None)):
+    """Return send queue depth, high-water mark and slow-consumer state per session"""
+    check_admin_token(x_admin_token)
+    return {client_id: queue.metrics() for client_id, queue in outbound_queues.items()}
+
+@app.get("/admin/chat-stream")
+async def admin_chat_stream(x_admin_token: Optional[str] = Header(None)):
+    """Return request and upstream call counts for /chat/stream"""
+    check_admin_token(x_admin_token)
+    return chat_flights.metrics()
+
+@app.get("/admin/speculation")
+async def admin_speculation(x_admin_token: Optional[str] = Header(None)):
+    """Return speculative reply hit rate and average latency saved"""
+    check_admin_token(x_admin_token)
+    return speculation.stats.metrics()
 
 if __name__ == "__main__":
     import uvicorn
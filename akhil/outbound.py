@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from fastapi import WebSocket, WebSocketDisconnect
+from config import Config
+from recorder import SessionRecorder
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to clients that stay too slow to keep up (1013: try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+class OutboundQueue:
+    """Bounded per-session send queue drained by a dedicated writer task.
+
+    Once the queue reaches the high watermark the client is considered behind
+    and new text chunks are merged into the last queued chunk until it drains
+    back to the low watermark. A client that stays behind for
+    Config.OUTBOUND_SLOW_TIMEOUT is degraded: every reply is collapsed into a
+    single chunk. If it is still behind after another timeout it is
+    disconnected. Time spent in the socket send itself is tracked here, since
+    turns only wait for a message to be queued.
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: str, recorder: SessionRecorder = None):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.recorder = recorder
+        self.queue = deque()
+        self.high_water = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.send_seconds = 0.0
+        self.send_max = 0.0
+        self.degraded = False
+        self.closed = False
+        self._behind_since = None
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def writer_task(self) -> asyncio.Task:
+        return self._writer
+
+    @property
+    def behind(self) -> bool:
+        return self._behind_since is not None
+
+    def metrics(self) -> dict:
+        return {
+            "depth": len(self.queue),
+            "high_water": self.high_water,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "send_ms_avg": round(self.send_seconds / self.sent * 1000, 2) if self.sent else None,
+            "send_ms_max": round(self.send_max * 1000, 2),
+            "behind": self.behind,
+            "degraded": self.degraded,
+        }
+
+    async def put(self, payload: dict):
+        """Queue a message for the client, waiting if the queue is full"""
+        await self._check_slow_consumer()
+        if self.closed:
+            raise WebSocketDisconnect(SLOW_CONSUMER_CLOSE_CODE)
+
+        is_chunk = payload.get("type") == "response_chunk"
+        if is_chunk and (self.behind or self.degraded) and self.queue and self.queue[-1].get("type") == "response_chunk":
+            tail = self.queue[-1]
+            self.queue[-1] = {**tail, "text": tail["text"] + payload["text"]}
+            self.coalesced += 1
+            return
+
+        while len(self.queue) >= Config.OUTBOUND_QUEUE_SIZE:
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), Config.OUTBOUND_SLOW_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self._disconnect("send queue stayed full")
+            if self.closed:
+                raise WebSocketDisconnect(SLOW_CONSUMER_CLOSE_CODE)
+
+        self.queue.append(payload)
+        self.high_water = max(self.high_water, len(self.queue))
+        if len(self.queue) >= Config.OUTBOUND_HIGH_WATERMARK and not self.behind:
+            self._behind_since = time.monotonic()
+        self._ready.set()
+
+    async def _check_slow_consumer(self):
+        """Degrade, then disconnect, a client that has been behind for too long"""
+        if not self.behind or time.monotonic() - self._behind_since < Config.OUTBOUND_SLOW_TIMEOUT:
+            return
+        if self.degraded:
+            await self._disconnect("client stayed behind after degrading")
+            return
+
+        logger.warning(f"Client {self.client_id} is falling behind, coalescing whole replies")
+        self.degraded = True
+        self._behind_since = time.monotonic()
+        self.queue.append({"type": "degraded", "reason": "slow_connection"})
+
+    async def _disconnect(self, reason: str):
+        if self.closed:
+            return
+        logger.warning(f"Disconnecting slow client {self.client_id}: {reason}")
+        self.closed = True
+        self._writer.cancel()
+        self._space.set()
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                if not self.queue:
+                    self._ready.clear()
+                    continue
+                if self.degraded and len(self.queue) == 1 and self.queue[0].get("type") == "response_chunk":
+                    # Hold the chunk back so the rest of the reply merges into it
+                    self._ready.clear()
+                    continue
+
+                payload = self.queue.popleft()
+                if len(self.queue) <= Config.OUTBOUND_LOW_WATERMARK:
+                    self._behind_since = None
+                self._space.set()
+
+                if self.recorder:
+                    self.recorder.outbound(payload)
+                started = time.perf_counter()
+                await self.websocket.send_text(json.dumps(payload))
+                elapsed = time.perf_counter() - started
+                self.send_seconds += elapsed
+                self.send_max = max(self.send_max, elapsed)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Writer for client {self.client_id} stopped: {e}")
+            self.closed = True
+            self._space.set()
+
+    async def close(self):
+        """Stop the writer, dropping anything still queued"""
+        self.closed = True
+        self._writer.cancel()
+        try:
+            await self._writer
+        except (asyncio.CancelledError, Exception):
+            pass
@@ -0,0 +1,136 @@
+import asyncio
+import io
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import AsyncGenerator, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Most recent turns that exceeded Config.SLOW_TURN_THRESHOLD, newest last
+slow_turns = deque(maxlen=Config.SLOW_TURN_HISTORY)
+
+_profile_lock = asyncio.Lock()
+
+def _fold_stack(frame) -> str:
+    """Render a frame and its callers as one folded-stack line, root first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def _sample(thread_id: int, interval: float, stop: threading.Event, counts: Counter):
+    """Sample the stack of one thread until stopped"""
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            counts[_fold_stack(frame)] += 1
+
+async def profile(seconds: float, interval: float = 0.01) -> str:
+    """Sample the event loop thread for a number of seconds.
+
+    Returns folded stacks (``frame;frame;frame count`` per line), the input
+    format of flamegraph.pl, speedscope and similar tools.
+    """
+    if _profile_lock.locked():
+        raise RuntimeError("A profile is already running")
+
+    async with _profile_lock:
+        counts = Counter()
+        stop = threading.Event()
+        # Called from the loop, so this is the thread running the event loop
+        sampler = threading.Thread(
+            target=_sample, args=(threading.get_ident(), interval, stop, counts), daemon=True
+        )
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+
+    logger.info(f"Profile finished: {sum(counts.values())} samples over {seconds}s")
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+def _task_stacks(tasks) -> list[dict]:
+    """Format the stacks of the given asyncio tasks"""
+    stacks = []
+    for task in tasks:
+        if task is None or task.done():
+            continue
+        buf = io.StringIO()
+        task.print_stack(file=buf)
+        stacks.append({"task": task.get_name(), "stack": buf.getvalue()})
+    return stacks
+
+class TurnTimer:
+    """Stage timings for one websocket turn, with task stacks captured if it runs slow.
+
+    Once a turn has been running for Config.SLOW_TURN_THRESHOLD seconds the
+    stacks of the task handling it and of its session's writer task are
+    snapshotted, so the capture shows where the turn is stuck rather than
+    where it ended up. Only the turn's own tasks are dumped, so the capture
+    stays cheap when many turns go slow at once.
+    """
+
+    def __init__(self, client_id: str, writer: Optional[asyncio.Task] = None):
+        self.client_id = client_id
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.task_stacks = None
+        self._tasks = (asyncio.current_task(), writer)
+        self._watchdog = asyncio.get_running_loop().call_later(Config.SLOW_TURN_THRESHOLD, self._capture)
+
+    def _capture(self):
+        self.task_stacks = _task_stacks(self._tasks)
+
+    def _add(self, stage: str, elapsed: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block and add it to the named stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - start)
+
+    async def track(self, stream: AsyncGenerator[str, None], name: str) -> AsyncGenerator[str, None]:
+        """Pass a stream through, adding the time spent waiting on it to the named stage"""
+        iterator = stream.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                self._add(name, time.perf_counter() - start)
+            yield chunk
+
+    def finish(self, message_type: Optional[str], error: Optional[BaseException] = None):
+        """Stop timing and keep the turn if it was slower than the threshold, whether or not it failed"""
+        self._watchdog.cancel()
+        total = time.perf_counter() - self.started
+        if total < Config.SLOW_TURN_THRESHOLD:
+            return
+
+        stages = {name: round(elapsed * 1000, 1) for name, elapsed in self.stages.items()}
+        outcome = f" failed with {type(error).__name__}" if error else ""
+        logger.warning(f"Slow {message_type} turn{outcome} for client {self.client_id}: {total:.2f}s {stages}")
+        slow_turns.append({
+            "client_id": self.client_id,
+            "type": message_type,
+            "error": f"{type(error).__name__}: {error}" if error else None,
+            "finished_at": time.time(),
+            "total_ms": round(total * 1000, 1),
+            "stages_ms": stages,
+            "task_stacks": self.task_stacks or [],
+        })
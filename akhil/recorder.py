@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import AsyncGenerator, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class SessionRecorder:
+    """Append-only recording of one /ws session for offline replay.
+
+    Each line of the session file is a compact JSON event with a time offset
+    (seconds since the session started). Inbound audio is stored once per
+    content hash under ``blobs/`` and referenced from the event by hash.
+    Events are buffered and written by a background task every
+    Config.RECORDING_FLUSH_INTERVAL seconds and at the end of each upstream
+    reply, so a slow disk never stalls the session it is recording.
+    """
+
+    def __init__(self, client_id: str, tenant_id: Optional[str] = None, model_name: Optional[str] = None,
+                 directory: Optional[str] = None):
+        self.directory = directory or Config.RECORDING_DIR
+        self.blob_dir = os.path.join(self.directory, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self.path = os.path.join(self.directory, f"{int(time.time())}-{client_id}.jsonl")
+        self.started = time.monotonic()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._pending: list[str] = []
+        self._closing = False
+        self._wake = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+        self._write({
+            "k": "session",
+            "client_id": client_id,
+            "tenant": tenant_id,
+            "model": model_name or Config.MODEL_NAME,
+            "wall": time.time(),
+        })
+        logger.info(f"Recording session {client_id} to {self.path}")
+
+    def _write(self, event: dict, at: Optional[float] = None):
+        event["t"] = round((time.monotonic() if at is None else at) - self.started, 4)
+        self._pending.append(json.dumps(event, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def _write_lines(self, text: str):
+        self._file.write(text)
+        self._file.flush()
+
+    async def _write_loop(self):
+        """Write buffered events from a worker thread until the recorder is closed"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), Config.RECORDING_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._pending:
+                text, self._pending = "".join(self._pending), []
+                try:
+                    await asyncio.to_thread(self._write_lines, text)
+                except OSError as e:
+                    logger.error(f"Error writing recording {self.path}: {e}")
+            if self._closing and not self._pending:
+                break
+        await asyncio.to_thread(self._file.close)
+
+    def _store_blob(self, encoded: str) -> str:
+        """Decode a base64 payload, store it by content hash and return the hash"""
+        data = base64.b64decode(encoded)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.blob_dir, digest)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        return digest
+
+    async def inbound(self, data: str):
+        """Record a raw frame received from the browser"""
+        received = time.monotonic()
+        try:
+            message = json.loads(data)
+        except ValueError:
+            self._write({"k": "in", "raw": data})
+            return
+
+        if isinstance(message, dict) and message.get("audio_data"):
+            message = dict(message)
+            # Decoding, hashing and writing audio can take milliseconds, so keep it off the event loop
+            message["audio_ref"] = await asyncio.to_thread(self._store_blob, message.pop("audio_data"))
+        self._write({"k": "in", "frame": message}, received)
+
+    def outbound(self, payload: dict):
+        """Record a frame sent to the browser"""
+        self._write({"k": "out", "frame": payload})
+
+    async def track_upstream(self, stream: AsyncGenerator[str, None], kind: str) -> AsyncGenerator[str, None]:
+        """Pass an upstream reply through while recording its timing and chunks"""
+        self._write({"k": "up_start", "kind": kind})
+        try:
+            async for chunk in stream:
+                self._write({"k": "up_chunk", "text": chunk})
+                yield chunk
+        finally:
+            self._write({"k": "up_end"})
+            self._wake.set()
+
+    async def close(self):
+        """Write out everything still buffered and close the session file"""
+        self._write({"k": "end"})
+        self._closing = True
+        self._wake.set()
+        await self._writer
+
+def load_recording(path: str) -> list[dict]:
+    """Read a session file back into a list of events"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_blob(recording_path: str, digest: str) -> bytes:
+    """Read a stored audio payload referenced from a recording"""
+    with open(os.path.join(os.path.dirname(recording_path), "blobs", digest), "rb") as f:
+        return f.read()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded /ws session against a local server for latency regression testing
+
+Usage:
+    python replay.py recordings/<session>.jsonl            # local server + recorded upstream
+    python replay.py recordings/<session>.jsonl --url ws://localhost:8000/ws/replay
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+import uvicorn
+import websockets
+import main
+from gemini_client import GeminiLiveClient
+from recorder import load_recording, load_blob
+from tenants import registry
+
+class RecordedChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+class RecordedResponse:
+    """Streams one recorded reply with its original timing, like AsyncGenerateContentResponse"""
+
+    def __init__(self, chat, content, turn: int, chunks: list, speed: float):
+        self.chat = chat
+        self.content = content
+        self.turn = turn
+        self.chunks = chunks
+        self.speed = speed
+
+    async def __aiter__(self):
+        for delay, text in self.chunks:
+            await asyncio.sleep(delay / self.speed)
+            yield RecordedChunk(text)
+        # Like the SDK, the turn only joins the chat history once the reply is fully read
+        self.chat.history += [
+            {"role": "user", "parts": [self.content]},
+            {"role": "model", "parts": ["".join(text for _, text in self.chunks)], "replay_turn": self.turn},
+        ]
+
+class RecordedChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, content, stream: bool = False):
+        # Replies are picked by how many turns this chat has completed, so hedged,
+        # speculative and retried requests for the same turn all get that turn's reply
+        turn = sum(1 for entry in self.history if isinstance(entry, dict) and "replay_turn" in entry)
+        chunks = self.model.turns[turn] if turn < len(self.model.turns) else []
+        return RecordedResponse(self, content, turn, chunks, self.model.speed)
+
+class RecordedModel:
+    """Stands in for the Gemini SDK model, serving recorded upstream replies to a real GeminiLiveClient"""
+
+    def __init__(self, turns: list, speed: float = 1.0):
+        self.turns = turns
+        self.speed = speed
+
+    def start_chat(self, history=None):
+        return RecordedChat(self, history)
+
+def upstream_turns(events: list) -> list:
+    """Extract each upstream reply as a list of (delay since previous event, chunk text)"""
+    turns = []
+    for event in events:
+        if event["k"] == "up_start":
+            turns.append([])
+            last = event["t"]
+        elif event["k"] == "up_chunk" and turns:
+            turns[-1].append((event["t"] - last, event["text"]))
+            last = event["t"]
+    return turns
+
+def is_turn(frame: dict) -> bool:
+    """Whether an inbound frame starts a model turn"""
+    if frame.get("type") == "audio":
+        return bool(frame.get("audio_data") or frame.get("audio_ref"))
+    return frame.get("type") in ("text", "audio_end")
+
+def restore_frame(event: dict, recording_path: str) -> str:
+    """Rebuild the original inbound frame, loading audio back from the blob store"""
+    if "raw" in event:
+        return event["raw"]
+    frame = dict(event["frame"])
+    if "audio_ref" in frame:
+        frame["audio_data"] = base64.b64encode(load_blob(recording_path, frame.pop("audio_ref"))).decode()
+    return json.dumps(frame)
+
+def turn_latencies(turn_starts: list, outbound: list) -> list:
+    """Pair each turn with its first chunk and end marker, returning (ttft, total) per turn"""
+    results = []
+    first_chunk = None
+    for t, frame in outbound:
+        if len(results) >= len(turn_starts):
+            break
+        frame_type = frame.get("type")
+        if frame_type == "response_chunk" and first_chunk is None:
+            first_chunk = t
+        elif frame_type in ("response_end", "error"):
+            start = turn_starts[len(results)]
+            ttft = first_chunk - start if first_chunk is not None else None
+            results.append((ttft, t - start))
+            first_chunk = None
+    return results
+
+async def drive(url: str, events: list, recording_path: str, speed: float, timeout: float) -> tuple:
+    """Send the recorded inbound frames with their original timing and collect the replies"""
+    inbound = [e for e in events if e["k"] == "in"]
+    expected = sum(1 for e in inbound if "frame" in e and is_turn(e["frame"]))
+    turn_starts = []
+    outbound = []
+    finished = asyncio.Event()
+
+    async with websockets.connect(url, max_size=None) as ws:
+        start = time.monotonic()
+
+        async def reader():
+            ended = 0
+            async for raw in ws:
+                frame = json.loads(raw)
+                outbound.append((time.monotonic() - start, frame))
+                if frame.get("type") in ("response_end", "error"):
+                    ended += 1
+                    if ended >= expected:
+                        finished.set()
+
+        reader_task = asyncio.create_task(reader())
+        for event in inbound:
+            await asyncio.sleep(max(0.0, event["t"] / speed - (time.monotonic() - start)))
+            if "frame" in event and is_turn(event["frame"]):
+                turn_starts.append(time.monotonic() - start)
+            await ws.send(restore_frame(event, recording_path))
+
+        if expected:
+            try:
+                await asyncio.wait_for(finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Timed out waiting for replies ({len(outbound)} frames received)")
+        reader_task.cancel()
+
+    return turn_starts, outbound
+
+def recorded_latencies(events: list) -> list:
+    """Compute per-turn latencies as they were observed in production"""
+    turn_starts = [e["t"] for e in events if e["k"] == "in" and "frame" in e and is_turn(e["frame"])]
+    outbound = [(e["t"], e["frame"]) for e in events if e["k"] == "out"]
+    return turn_latencies(turn_starts, outbound)
+
+def fmt(value) -> str:
+    return f"{value * 1000:8.0f}ms" if value is not None else "       -  "
+
+def print_report(recorded: list, replayed: list, speed: float):
+    """Print recorded vs replayed latency for every turn"""
+    print(f"\n{'turn':>4}  {'rec ttft':>10}  {'rep ttft':>10}  {'rec total':>10}  {'rep total':>10}")
+    for i in range(max(len(recorded), len(replayed))):
+        rec = recorded[i] if i < len(recorded) else (None, None)
+        rep = replayed[i] if i < len(replayed) else (None, None)
+        # Recorded times are scaled to the replay speed so the columns are comparable
+        rec = tuple(v / speed if v is not None else None for v in rec)
+        print(f"{i + 1:>4}  {fmt(rec[0])}  {fmt(rep[0])}  {fmt(rec[1])}  {fmt(rep[1])}")
+
+    totals = sorted(t for _, t in replayed)
+    if totals:
+        print(f"\nReplayed turns: {len(totals)}  p50 total: {fmt(totals[len(totals) // 2]).strip()}  "
+              f"max total: {fmt(totals[-1]).strip()}")
+
+async def run(args):
+    events = load_recording(args.recording)
+    server = None
+    url = args.url
+
+    if not url:
+        # Serve the app in-process with the recorded upstream in place of the Gemini SDK
+        turns = upstream_turns(events)
+        main.client_factory = lambda tenant: GeminiLiveClient(tenant, RecordedModel(turns, args.speed))
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        tenant_id = events[0].get("tenant")
+        if tenant_id in registry.tenants:
+            url = f"ws://127.0.0.1:{args.port}/ws/{tenant_id}/replay"
+        else:
+            url = f"ws://127.0.0.1:{args.port}/ws/replay"
+
+    try:
+        turn_starts, outbound = await drive(url, events, args.recording, args.speed, args.timeout)
+    finally:
+        if server:
+            server.should_exit = True
+            await server_task
+
+    print_report(recorded_latencies(events), turn_latencies(turn_starts, outbound), args.speed)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay a recorded voice chat session")
+    parser.add_argument("recording", help="Session file written with RECORDING_ENABLED=true")
+    parser.add_argument("--url", help="Drive an already running server instead of a local one with a recorded upstream")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the local replay server")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for outstanding replies")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main_cli()
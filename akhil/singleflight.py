@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import re
+from typing import AsyncGenerator, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(text: str) -> str:
+    """Reduce a question to lowercase words so trivially different phrasings share a flight"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+class Flight:
+    """One upstream reply being streamed to any number of subscribers.
+
+    Chunks are kept for the lifetime of the flight, so a caller that joins
+    late still receives the whole reply from the start.
+    """
+
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: str):
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: Exception = None):
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.chunks) or self.done)
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done and sent >= len(self.chunks):
+                break
+        if self.error:
+            raise self.error
+
+class SingleFlight:
+    """Shares one upstream stream between concurrent callers asking the same thing.
+
+    The upstream stream runs in its own task so callers can come and go; it is
+    cancelled only when every caller has left. Finished flights are dropped
+    straight away, so nothing is cached beyond the lifetime of a reply.
+    """
+
+    def __init__(self):
+        self.flights: dict[tuple, Flight] = {}
+        self.requests = 0
+        self.upstream_calls = 0
+
+    def metrics(self) -> dict:
+        return {
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.requests - self.upstream_calls,
+            "in_flight": len(self.flights),
+        }
+
+    def stream(self, key: tuple, start: Callable[[], AsyncGenerator[str, None]],
+               admit: Optional[Callable[[], bool]] = None) -> Optional[AsyncGenerator[str, None]]:
+        """Join the flight for key, or start one, and return a stream of its reply.
+
+        The flight is joined or created right away rather than when the stream
+        is first read, so a flight cannot finish in between. ``admit`` runs
+        only when a new upstream call is needed; if it returns False no flight
+        is started and None is returned.
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            if admit and not admit():
+                return None
+            flight = self.flights[key] = Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, start))
+            self.upstream_calls += 1
+
+        self.requests += 1
+        flight.subscribers += 1
+        return self._subscribe(key, flight)
+
+    async def _subscribe(self, key: tuple, flight: Flight) -> AsyncGenerator[str, None]:
+        try:
+            async for chunk in flight.subscribe():
+                yield chunk
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more, so stop paying for the upstream reply
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: tuple, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def _run(self, key: tuple, flight: Flight, start: Callable[[], AsyncGenerator[str, None]]):
+        error = None
+        try:
+            async for chunk in start():
+                await flight.publish(chunk)
+        except asyncio.CancelledError:
+            error = ConnectionAbortedError("Upstream reply was cancelled")
+        except Exception as e:
+            logger.error(f"Error in coalesced upstream reply: {e}")
+            error = e
+        finally:
+            self._forget(key, flight)
+            await flight.finish(error)
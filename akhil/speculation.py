@@ -0,0 +1,254 @@
+import asyncio
+import importlib
+import logging
+import time
+from collections import deque
+from typing import AsyncGenerator, Optional
+from config import Config
+from singleflight import Flight, normalize_question
+from tenants import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+class Recognizer:
+    """Incremental speech recognizer used to transcribe streamed audio.
+
+    Implementations keep the state of one utterance: ``feed`` takes the next
+    audio chunk and returns the transcript so far, ``finish`` returns the final
+    transcript and resets for the next utterance. Both are called from a worker
+    thread, so they may block.
+    """
+
+    def feed(self, audio: bytes) -> str:
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        raise NotImplementedError
+
+class StubRecognizer(Recognizer):
+    """Test recognizer that reads each audio chunk as UTF-8 text"""
+
+    def __init__(self):
+        self.parts = []
+
+    def feed(self, audio: bytes) -> str:
+        self.parts.append(audio.decode("utf-8", errors="ignore"))
+        return "".join(self.parts)
+
+    def finish(self) -> str:
+        transcript = "".join(self.parts)
+        self.parts = []
+        return transcript
+
+def load_recognizer() -> Optional[Recognizer]:
+    """Create the recognizer named by Config.SPECULATIVE_RECOGNIZER ("module:Class"), if any"""
+    if not Config.SPECULATIVE_RECOGNIZER:
+        return None
+    module_name, _, class_name = Config.SPECULATIVE_RECOGNIZER.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+class SpeculationStats:
+    """Process-wide speculation outcomes"""
+
+    def __init__(self):
+        self.turns = 0
+        self.hits = 0
+        self.misses = 0
+        self.restarts = 0
+        self.failures = 0
+        self.saved = deque(maxlen=Config.HEDGE_SAMPLE_WINDOW)
+
+    def metrics(self) -> dict:
+        speculated = self.hits + self.misses + self.failures
+        return {
+            "turns": self.turns,
+            "speculated": speculated,
+            "hits": self.hits,
+            "misses": self.misses,
+            "restarts": self.restarts,
+            "failures": self.failures,
+            "hit_rate": round(self.hits / speculated, 3) if speculated else None,
+            "avg_saved_ms": round(sum(self.saved) / len(self.saved) * 1000, 1) if self.saved else None,
+        }
+
+stats = SpeculationStats()
+
+class Speculation:
+    """A text turn started from a partial transcript, buffered until committed or cancelled"""
+
+    def __init__(self, transcript: str, client):
+        self.transcript = transcript
+        self.normalized = normalize_question(transcript)
+        self.client = client
+        self.flight = Flight()
+        self.started = time.monotonic()
+        self.first_chunk_at = None
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        error = None
+        try:
+            # Errors must reach the subscriber rather than arrive as reply text, so a failed
+            # speculative turn can be retried instead of being served as the answer
+            async for chunk in self.client.stream_text_message(self.transcript):
+                if self.first_chunk_at is None:
+                    self.first_chunk_at = time.monotonic()
+                await self.flight.publish(chunk)
+        except asyncio.CancelledError:
+            error = ConnectionAbortedError("Speculative turn was cancelled")
+        except Exception as e:
+            error = e
+        finally:
+            await self.flight.finish(error)
+
+class Speculator:
+    """Collects one streamed utterance and answers it speculatively before it ends.
+
+    Each audio chunk goes to the recognizer. Once the partial transcript has
+    stayed the same for Config.SPECULATION_STABLE_CHUNKS chunks, a text turn is
+    started on a fork of the conversation. When the utterance ends the turn is
+    committed if the final transcript matches, and the fork becomes the
+    session's client; otherwise it is cancelled and the final transcript is
+    sent instead. A speculative turn that fails before its first chunk is
+    retried the same way. Without a recognizer the chunks are sent as one
+    audio message.
+    Speculative turns are upstream calls too, so each one is charged against
+    the session's rate limiter and skipped when it is exhausted.
+    """
+
+    def __init__(self, client, recognizer: Optional[Recognizer], client_id: str,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.client = client
+        self.recognizer = recognizer
+        self.client_id = client_id
+        self.rate_limiter = rate_limiter
+        self.audio = []
+        self.audio_bytes = 0
+        self._partial = ""
+        self._stable = 0
+        self._speculation = None
+        self._too_long = False
+
+    async def feed(self, audio: bytes):
+        """Add the next audio chunk, starting or restarting speculation as the transcript settles.
+
+        An utterance that would grow past Config.STREAMED_AUDIO_MAX_BYTES or
+        Config.STREAMED_AUDIO_MAX_CHUNKS is dropped with a ValueError, and the
+        rest of its chunks are ignored until it ends.
+        """
+        if self._too_long:
+            return
+        if (self.audio_bytes + len(audio) > Config.STREAMED_AUDIO_MAX_BYTES
+                or len(self.audio) >= Config.STREAMED_AUDIO_MAX_CHUNKS):
+            await self.reset()
+            self._too_long = True
+            raise ValueError("Recording is too long, please ask a shorter question")
+
+        self.audio.append(audio)
+        self.audio_bytes += len(audio)
+        if not self.recognizer:
+            return
+
+        partial = await asyncio.to_thread(self.recognizer.feed, audio)
+        if normalize_question(partial) != normalize_question(self._partial):
+            self._partial = partial
+            self._stable = 0
+            if self._speculation:
+                self._cancel()
+                stats.restarts += 1
+            return
+
+        self._stable += 1
+        if (self._speculation is None and self._stable >= Config.SPECULATION_STABLE_CHUNKS
+                and len(partial.split()) >= Config.SPECULATION_MIN_WORDS):
+            if self.rate_limiter and not self.rate_limiter.allow():
+                return
+            logger.info(f"Speculating for client {self.client_id} on: {partial!r}")
+            self._speculation = Speculation(partial, self.client.fork())
+
+    def _cancel(self):
+        self._speculation.task.cancel()
+        self._speculation = None
+
+    def discard(self):
+        """Drop the pending speculation because another turn is about to change the conversation.
+
+        The speculative reply runs on a fork taken before that turn, so
+        committing it would lose the turn from the history. Speculation
+        starts again on the next stable chunks.
+        """
+        if self._speculation:
+            logger.info(f"Discarding speculative turn for client {self.client_id}: the conversation moved on")
+            self._cancel()
+            self._stable = 0
+
+    async def reset(self):
+        """Drop the utterance collected so far without answering it"""
+        self.audio = []
+        self.audio_bytes = 0
+        self._too_long = False
+        self._partial = ""
+        self._stable = 0
+        if self._speculation:
+            self._cancel()
+        if self.recognizer:
+            await asyncio.to_thread(self.recognizer.finish)
+
+    async def finish(self, mime_type: str = "audio/webm") -> AsyncGenerator[str, None]:
+        """End the utterance and stream the reply"""
+        if self._too_long:
+            # Already dropped and reported when it went over the limit
+            self._too_long = False
+            return
+
+        audio = b"".join(self.audio)
+        self.audio = []
+        self.audio_bytes = 0
+        self._partial = ""
+        self._stable = 0
+        transcript = await asyncio.to_thread(self.recognizer.finish) if self.recognizer else ""
+        speculation, self._speculation = self._speculation, None
+        committed_at = time.monotonic()
+        stats.turns += 1
+
+        if speculation and speculation.normalized == normalize_question(transcript):
+            saved = None
+            try:
+                async for chunk in speculation.flight.subscribe():
+                    if saved is None:
+                        # Unspeculated, the first chunk would have taken as long after the
+                        # utterance ended as it took after the speculative turn started
+                        saved = committed_at + (speculation.first_chunk_at - speculation.started) - time.monotonic()
+                    yield chunk
+            except Exception as e:
+                if saved is not None:
+                    # Part of the reply has been sent, so fail the turn as an unspeculated one would
+                    logger.error(f"Speculative turn failed for client {self.client_id}: {e}")
+                    yield f"Error: {str(e)}"
+                    return
+                stats.failures += 1
+                logger.info(f"Speculative turn failed for client {self.client_id}, retrying: {e}")
+                speculation = None
+            else:
+                stats.hits += 1
+                self.client = speculation.client
+                if saved is not None:
+                    stats.saved.append(saved)
+                    logger.info(f"Speculative hit for client {self.client_id}, saved {saved * 1000:.0f}ms")
+                return
+
+        if speculation:
+            stats.misses += 1
+            speculation.task.cancel()
+            logger.info(f"Speculative miss for client {self.client_id}: {speculation.transcript!r} != {transcript!r}")
+
+        if transcript.strip():
+            stream = self.client.send_text_message(transcript)
+        else:
+            stream = self.client.send_audio_message(audio, mime_type)
+        async for chunk in stream:
+            yield chunk
+
+    def close(self):
+        if self._speculation:
+            self._cancel()
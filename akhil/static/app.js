@@ -7,6 +7,9 @@ class VoiceChatApp {
         this.isConnected = false;
         this.clientId = this.generateClientId();
         this.currentResponse = '';
+        // With ?streaming=1 audio is sent while recording so the server can start answering early
+        this.streamAudio = new URLSearchParams(window.location.search).get('streaming') === '1';
+        this.chunkUploads = Promise.resolve();
         
         this.initializeElements();
         this.bindEvents();
@@ -51,7 +54,10 @@ class VoiceChatApp {
 
     connectWebSocket() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/${this.clientId}`;
+        // Branded assistants are selected with ?tenant=<id> on the page URL
+        const tenant = new URLSearchParams(window.location.search).get('tenant');
+        const path = tenant ? `${encodeURIComponent(tenant)}/${this.clientId}` : this.clientId;
+        const wsUrl = `${protocol}//${window.location.host}/ws/${path}`;
         
         this.updateStatus('connecting');
         
@@ -154,6 +160,9 @@ class VoiceChatApp {
             this.mediaRecorder.ondataavailable = (event) => {
                 if (event.data.size > 0) {
                     this.audioChunks.push(event.data);
+                    if (this.streamAudio) {
+                        this.sendAudioChunk(event.data);
+                    }
                     this.lastAudioTime = Date.now();
                     
                     // Reset silence timer
@@ -186,7 +195,11 @@ class VoiceChatApp {
                 stream.getTracks().forEach(track => track.stop());
             };
             
-            this.mediaRecorder.start();
+            if (this.streamAudio) {
+                this.mediaRecorder.start(250);
+            } else {
+                this.mediaRecorder.start();
+            }
             this.isRecording = true;
             this.micButton.classList.add('recording');
             this.recordingIndicator.classList.add('active');
@@ -241,6 +254,17 @@ class VoiceChatApp {
             return;
         }
         
+        if (this.streamAudio) {
+            // Chunks were already sent while recording; mark the end once they are all out
+            this.chunkUploads = this.chunkUploads.then(() => {
+                if (this.isConnected) {
+                    this.statusText.textContent = 'Sending your message...';
+                    this.ws.send(JSON.stringify({ type: 'audio_end', mime_type: 'audio/webm' }));
+                }
+            });
+            return;
+        }
+        
         console.log(`Processing ${this.audioChunks.length} audio chunks...`);
         const audioBlob = new Blob(this.audioChunks, { type: 'audio/webm' });
         console.log(`Audio blob size: ${audioBlob.size} bytes`);
@@ -256,6 +280,25 @@ class VoiceChatApp {
         reader.readAsDataURL(audioBlob);
     }
 
+    readAsBase64(blob) {
+        return new Promise((resolve, reject) => {
+            const reader = new FileReader();
+            reader.onload = () => resolve(reader.result.split(',')[1]);
+            reader.onerror = () => reject(reader.error);
+            reader.readAsDataURL(blob);
+        });
+    }
+
+    sendAudioChunk(blob) {
+        // Chained so chunks reach the server in recording order
+        this.chunkUploads = this.chunkUploads.then(async () => {
+            const audioData = await this.readAsBase64(blob);
+            if (this.isConnected) {
+                this.ws.send(JSON.stringify({ type: 'audio_chunk', audio_data: audioData, mime_type: 'audio/webm' }));
+            }
+        }).catch((error) => console.error('Error sending audio chunk:', error));
+    }
+
     sendAudioMessage(audioData) {
         if (!this.isConnected) {
             console.error('WebSocket not connected');
@@ -297,6 +340,10 @@ class VoiceChatApp {
             case 'pong':
                 // Handle ping/pong for connection health
                 break;
+            case 'degraded':
+                // Server is sending each reply as a single chunk because the connection is slow
+                console.warn('Slow connection, replies will arrive in one piece:', data.reason);
+                break;
         }
     }
 
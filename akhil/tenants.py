@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+import google.generativeai as genai
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Model handles are stateless, so tenants on the same model share one
+_models: dict[str, genai.GenerativeModel] = {}
+
+class RateLimiter:
+    """Token bucket allowing a number of turns per minute"""
+
+    def __init__(self, turns_per_minute: int):
+        self.capacity = turns_per_minute
+        self.tokens = float(turns_per_minute)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        if not self.capacity:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class Tenant:
+    """One branded assistant: its model, compiled prompt, knowledge data and limits"""
+
+    def __init__(self, tenant_id: str, assistant_name: str, model_name: str, system_instructions: str,
+                 knowledge: dict, turns_per_minute: int = 0, max_sessions: int = 0,
+                 chat_turns_per_minute: Optional[int] = None):
+        self.tenant_id = tenant_id
+        self.assistant_name = assistant_name
+        self.model_name = model_name
+        self.system_instructions = system_instructions
+        # Every conversation starts from this exchange, so the prompt applies from the first turn
+        self.prompt_history = [
+            {"role": "user", "parts": [system_instructions]},
+            {"role": "model", "parts": ["Understood."]},
+        ]
+        self.knowledge = knowledge
+        self.max_sessions = max_sessions
+        self.active_sessions = 0
+        self.rate_limiter = RateLimiter(turns_per_minute)
+        # /chat/stream has its own limit, which is never unlimited by default
+        self.chat_rate_limiter = RateLimiter(
+            Config.CHAT_TURNS_PER_MINUTE if chat_turns_per_minute is None else chat_turns_per_minute
+        )
+        # Time-to-first-token samples for this tenant's model, used for the hedge threshold
+        self.first_token_latencies = deque(maxlen=Config.HEDGE_SAMPLE_WINDOW)
+
+    @property
+    def model(self) -> genai.GenerativeModel:
+        """Shared model handle, created on first use"""
+        if self.model_name not in _models:
+            _models[self.model_name] = genai.GenerativeModel(self.model_name)
+        return _models[self.model_name]
+
+    def has_capacity(self) -> bool:
+        return not self.max_sessions or self.active_sessions < self.max_sessions
+
+    @classmethod
+    def from_dict(cls, tenant_id: str, data: dict, base_dir: str = "."):
+        """Build a tenant from its entry in the tenants file"""
+        knowledge = data.get("knowledge", {})
+        if "knowledge_file" in data:
+            with open(os.path.join(base_dir, data["knowledge_file"]), "r", encoding="utf-8") as f:
+                knowledge = json.load(f)
+
+        assistant_name = data.get("assistant_name", "Rev")
+        # The prompt is compiled once here rather than for every session
+        system_instructions = data["prompt"].format(
+            assistant_name=assistant_name,
+            knowledge=json.dumps(knowledge, indent=2, ensure_ascii=False),
+        )
+        return cls(
+            tenant_id=tenant_id,
+            assistant_name=assistant_name,
+            model_name=data.get("model", Config.MODEL_NAME),
+            system_instructions=system_instructions,
+            knowledge=knowledge,
+            turns_per_minute=data.get("turns_per_minute", 0),
+            max_sessions=data.get("max_sessions", 0),
+            chat_turns_per_minute=data.get("chat_turns_per_minute"),
+        )
+
+class TenantRegistry:
+    """All tenants served by this process, keyed by tenant id"""
+
+    def __init__(self):
+        self.default_id = Config.DEFAULT_TENANT
+        self.tenants: dict[str, Tenant] = {
+            Config.DEFAULT_TENANT: Tenant(
+                tenant_id=Config.DEFAULT_TENANT,
+                assistant_name="Rev",
+                model_name=Config.MODEL_NAME,
+                system_instructions=Config.SYSTEM_INSTRUCTIONS,
+                knowledge=Config.REVOLT_DATA,
+            )
+        }
+
+    def load(self, path: str):
+        """Add the tenants defined in a JSON file"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        base_dir = os.path.dirname(os.path.abspath(path))
+        for tenant_id, entry in data.get("tenants", {}).items():
+            self.tenants[tenant_id] = Tenant.from_dict(tenant_id, entry, base_dir)
+        self.default_id = data.get("default", self.default_id)
+        logger.info(f"Loaded {len(self.tenants)} tenants from {path}")
+
+    @property
+    def default(self) -> Tenant:
+        return self.tenants[self.default_id]
+
+    def resolve(self, tenant_id: Optional[str]) -> Optional[Tenant]:
+        """Return the requested tenant, the default when none is given, or None if unknown"""
+        if not tenant_id:
+            return self.default
+        return self.tenants.get(tenant_id)
+
+registry = TenantRegistry()
+if Config.TENANTS_FILE and os.path.exists(Config.TENANTS_FILE):
+    registry.load(Config.TENANTS_FILE)
@@ -0,0 +1,152 @@
+"""
+Offline tests for the upstream deadlines and hedging in GeminiLiveClient._stream_response
+"""
+
+import asyncio
+import pytest
+from config import Config
+from gemini_client import GeminiLiveClient
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeResponse:
+    """Streams a scripted reply of (delay, text) steps, like AsyncGenerateContentResponse"""
+
+    def __init__(self, model, chat, content, script):
+        self.model = model
+        self.chat = chat
+        self.content = content
+        self.script = script
+
+    def __aiter__(self):
+        stream = self._chunks()
+        # Keep a reference so a leaked stream is not closed by garbage collection
+        self.model.streams.append(stream)
+        return stream
+
+    async def _chunks(self):
+        finished = False
+        try:
+            for step, text in self.script:
+                if isinstance(step, asyncio.Event):
+                    await step.wait()
+                else:
+                    await asyncio.sleep(step)
+                yield FakeChunk(text)
+            finished = True
+            # The SDK only adds the turn to the chat history once the reply is fully read
+            self.chat.history += [self.content, "".join(text for _, text in self.script)]
+        finally:
+            if not finished:
+                self.model.closed += 1
+
+class FakeChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, content, stream=False):
+        script = self.model.scripts[self.model.sends]
+        self.model.sends += 1
+        return FakeResponse(self.model, self, content, script)
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel; each request gets the next script"""
+
+    def __init__(self, *scripts):
+        self.scripts = scripts
+        self.sends = 0
+        self.closed = 0
+        self.streams = []
+
+    def start_chat(self, history=None):
+        return FakeChat(self, history)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Config, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(Config, "FIRST_TOKEN_TIMEOUT", 0.5)
+    monkeypatch.setattr(Config, "INTER_TOKEN_TIMEOUT", 0.5)
+    monkeypatch.setattr(Config, "HEDGE_ENABLED", False)
+    client = GeminiLiveClient()
+    monkeypatch.setattr(client.tenant, "first_token_latencies", [])
+    return client
+
+def reply(client, model, text="Tell me about the RV400"):
+    """Run one text turn on model and return the chunks and the history before the turn"""
+    async def run():
+        await client.start_conversation()
+        client.model = model
+        client.conversation = model.start_chat(history=client.conversation.history)
+        before = list(client.conversation.history)
+        return [chunk async for chunk in client.send_text_message(text)], before
+    return asyncio.run(run())
+
+def test_reply_is_added_to_history(client):
+    model = FakeModel([(0, "The RV400 "), (0, "has 150 km range")])
+    chunks, before = reply(client, model)
+    assert chunks == ["The RV400 ", "has 150 km range"]
+    assert client.conversation.history == before + ["Tell me about the RV400", "The RV400 has 150 km range"]
+
+def test_hedged_request_wins(client, monkeypatch):
+    monkeypatch.setattr(Config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(Config, "HEDGE_DELAY", 0.05)
+    model = FakeModel([(5, "slow")], [(0, "fast "), (0, "reply")])
+    chunks, before = reply(client, model)
+    assert chunks == ["fast ", "reply"]
+    assert model.sends == 2
+    assert model.closed == 1
+    assert client.conversation.history == before + ["Tell me about the RV400", "fast reply"]
+
+def test_simultaneous_answers_close_the_loser(client, monkeypatch):
+    monkeypatch.setattr(Config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(Config, "HEDGE_DELAY", 0.01)
+
+    async def run():
+        ready = asyncio.Event()
+        model = FakeModel([(ready, "one "), (0, "reply")], [(ready, "two "), (0, "reply")])
+        await client.start_conversation()
+        client.model = model
+        client.conversation = model.start_chat()
+
+        async def release():
+            while model.sends < 2:
+                await asyncio.sleep(0.01)
+            ready.set()
+
+        releaser = asyncio.create_task(release())
+        chunks = [chunk async for chunk in client.send_text_message("hi")]
+        await releaser
+        return chunks, model.closed
+
+    chunks, closed = asyncio.run(run())
+    assert chunks in (["one ", "reply"], ["two ", "reply"])
+    assert closed == 1
+
+def test_first_token_timeout(client, monkeypatch):
+    monkeypatch.setattr(Config, "FIRST_TOKEN_TIMEOUT", 0.05)
+    model = FakeModel([(5, "late")])
+    chunks, before = reply(client, model)
+    assert len(chunks) == 1 and chunks[0].startswith("Error: No response from model")
+    assert client.conversation.history == before
+
+def test_stalled_stream_leaves_history_untouched(client, monkeypatch):
+    monkeypatch.setattr(Config, "INTER_TOKEN_TIMEOUT", 0.05)
+    model = FakeModel([(0, "The RV400 "), (5, "has 150 km range")])
+    chunks, before = reply(client, model)
+    assert chunks[0] == "The RV400 "
+    assert chunks[1].startswith("Error: Model stream stalled")
+    assert client.conversation.history == before
+    assert model.closed == 1
+
+def test_conversation_starts_with_tenant_prompt(client):
+    async def run():
+        client.model = FakeModel([(0, "Hi")])
+        await client.start_conversation()
+        return client.conversation.history, client.fork().conversation.history
+
+    history, forked = asyncio.run(run())
+    assert history[0] == {"role": "user", "parts": [client.tenant.system_instructions]}
+    assert forked == history
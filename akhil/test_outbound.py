@@ -0,0 +1,122 @@
+"""
+Offline tests for the per-session outbound queue and its slow-consumer policy
+"""
+
+import asyncio
+import json
+import pytest
+from fastapi import WebSocketDisconnect
+from config import Config
+from outbound import SLOW_CONSUMER_CLOSE_CODE, OutboundQueue
+
+class FakeWebSocket:
+    """Collects sent frames, taking send_delay per frame or blocking until released"""
+
+    def __init__(self, send_delay: float = 0.0, stuck: bool = False):
+        self.send_delay = send_delay
+        self.released = asyncio.Event()
+        if not stuck:
+            self.released.set()
+        self.frames = []
+        self.close_code = None
+
+    async def send_text(self, data: str):
+        await self.released.wait()
+        await asyncio.sleep(self.send_delay)
+        self.frames.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(Config, "OUTBOUND_QUEUE_SIZE", 64)
+    monkeypatch.setattr(Config, "OUTBOUND_HIGH_WATERMARK", 8)
+    monkeypatch.setattr(Config, "OUTBOUND_LOW_WATERMARK", 2)
+    monkeypatch.setattr(Config, "OUTBOUND_SLOW_TIMEOUT", 0.1)
+
+async def drain(queue: OutboundQueue, ws: FakeWebSocket, frames: int, timeout: float = 2.0):
+    """Wait until the socket has received the given number of frames"""
+    async def wait():
+        while len(ws.frames) < frames:
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(wait(), timeout)
+
+def reply_text(frames: list) -> str:
+    return "".join(f["text"] for f in frames if f["type"] == "response_chunk")
+
+def test_fast_client_gets_every_chunk():
+    async def run():
+        ws = FakeWebSocket()
+        queue = OutboundQueue(ws, "fast")
+        for i in range(20):
+            await queue.put({"type": "response_chunk", "text": f"{i} "})
+            await asyncio.sleep(0)
+        await queue.put({"type": "response_end"})
+        await drain(queue, ws, 21)
+        await queue.close()
+        return ws, queue
+
+    ws, queue = asyncio.run(run())
+    assert [f["text"] for f in ws.frames[:-1]] == [f"{i} " for i in range(20)]
+    assert ws.frames[-1] == {"type": "response_end"}
+    assert queue.coalesced == 0 and not queue.degraded
+
+def test_lagging_client_gets_coalesced_chunks():
+    async def run():
+        ws = FakeWebSocket(send_delay=0.005)
+        queue = OutboundQueue(ws, "lagging")
+        for i in range(100):
+            await queue.put({"type": "response_chunk", "text": f"{i} "})
+        await queue.put({"type": "response_end"})
+        # Once merged, the reply arrives in far fewer frames than it was produced in
+        await drain(queue, ws, 1)
+        while ws.frames[-1]["type"] != "response_end":
+            await asyncio.sleep(0.005)
+        await queue.close()
+        return ws, queue
+
+    ws, queue = asyncio.run(run())
+    assert queue.coalesced > 0
+    assert len(ws.frames) < 101
+    assert reply_text(ws.frames) == "".join(f"{i} " for i in range(100))
+    assert not queue.degraded
+
+def test_stuck_client_is_degraded_then_disconnected():
+    async def run():
+        ws = FakeWebSocket(stuck=True)
+        queue = OutboundQueue(ws, "stuck")
+        degraded_at = None
+        with pytest.raises(WebSocketDisconnect):
+            for i in range(1000):
+                await queue.put({"type": "response_chunk", "text": f"{i} "})
+                if queue.degraded and degraded_at is None:
+                    degraded_at = i
+                await asyncio.sleep(0.01)
+        await queue.close()
+        return ws, queue, degraded_at
+
+    ws, queue, degraded_at = asyncio.run(run())
+    assert degraded_at is not None
+    assert {"type": "degraded", "reason": "slow_connection"} in queue.queue
+    assert queue.closed
+    assert ws.close_code == SLOW_CONSUMER_CLOSE_CODE
+
+def test_degraded_client_gets_whole_reply_on_response_end():
+    async def run():
+        ws = FakeWebSocket()
+        queue = OutboundQueue(ws, "degraded")
+        queue.degraded = True
+        for i in range(5):
+            await queue.put({"type": "response_chunk", "text": f"{i} "})
+            await asyncio.sleep(0.01)
+        # The reply is held back while it may still grow
+        held = list(ws.frames)
+        await queue.put({"type": "response_end"})
+        await drain(queue, ws, 2)
+        await queue.close()
+        return held, ws
+
+    held, ws = asyncio.run(run())
+    assert held == []
+    assert ws.frames == [{"type": "response_chunk", "text": "0 1 2 3 4 "}, {"type": "response_end"}]
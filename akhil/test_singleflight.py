@@ -0,0 +1,114 @@
+"""
+Offline tests for request coalescing in SingleFlight
+"""
+
+import asyncio
+import pytest
+from singleflight import SingleFlight, normalize_question
+
+class Upstream:
+    """Fake upstream reply that counts calls and notices cancellation"""
+
+    def __init__(self, chunks: int = 3, delay: float = 0.02, error: Exception = None):
+        self.chunks = chunks
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    async def reply(self):
+        self.calls += 1
+        try:
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                yield f"{i} "
+            if self.error:
+                raise self.error
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+async def collect(stream) -> str:
+    return "".join([chunk async for chunk in stream])
+
+def test_normalize_question():
+    assert normalize_question("  What's the RV400 price?? ") == normalize_question("what s the rv400 price")
+
+def test_late_joiner_gets_the_whole_reply():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        first = asyncio.create_task(collect(flights.stream(("rev", "q"), upstream.reply)))
+        await asyncio.sleep(0.03)
+        late = await collect(flights.stream(("rev", "q"), upstream.reply))
+        return await first, late, upstream.calls, flights
+
+    first, late, calls, flights = asyncio.run(run())
+    assert first == late == "0 1 2 "
+    assert calls == 1
+    assert flights.metrics() == {"requests": 2, "upstream_calls": 1, "coalesced": 1, "in_flight": 0}
+
+def test_admit_runs_once_per_upstream_call():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        admitted = []
+        admit = lambda: admitted.append(1) or True
+        # Concurrent first callers share one flight and are charged once
+        streams = [flights.stream(("rev", "q"), upstream.reply, admit) for _ in range(5)]
+        replies = await asyncio.gather(*(collect(s) for s in streams))
+        return replies, len(admitted), upstream.calls
+
+    replies, admitted, calls = asyncio.run(run())
+    assert replies == ["0 1 2 "] * 5
+    assert admitted == 1 and calls == 1
+
+def test_rejected_flight_is_not_started():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        stream = flights.stream(("rev", "q"), upstream.reply, admit=lambda: False)
+        await asyncio.sleep(0.01)
+        return stream, upstream.calls, flights.flights
+
+    stream, calls, in_flight = asyncio.run(run())
+    assert stream is None
+    assert calls == 0 and in_flight == {}
+
+def test_upstream_is_cancelled_when_last_subscriber_leaves():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(chunks=10)
+        streams = [flights.stream(("rev", "q"), upstream.reply) for _ in range(2)]
+        for stream in streams:
+            await stream.__anext__()
+        await streams[0].aclose()
+        await asyncio.sleep(0.01)
+        still_running = not upstream.cancelled
+        await streams[1].aclose()
+        await asyncio.sleep(0.01)
+        return still_running, upstream.cancelled, flights.flights
+
+    still_running, cancelled, in_flight = asyncio.run(run())
+    assert still_running
+    assert cancelled
+    assert in_flight == {}
+
+def test_error_reaches_every_subscriber():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(error=RuntimeError("upstream broke"))
+
+        async def read(stream):
+            chunks = []
+            with pytest.raises(RuntimeError, match="upstream broke"):
+                async for chunk in stream:
+                    chunks.append(chunk)
+            return "".join(chunks)
+
+        streams = [flights.stream(("rev", "q"), upstream.reply) for _ in range(3)]
+        return await asyncio.gather(*(read(s) for s in streams)), flights.flights
+
+    partials, in_flight = asyncio.run(run())
+    assert partials == ["0 1 2 "] * 3
+    assert in_flight == {}
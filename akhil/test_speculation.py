@@ -0,0 +1,200 @@
+"""
+Offline tests for speculative replies to streamed audio
+"""
+
+import asyncio
+import pytest
+import speculation
+from config import Config
+from speculation import SpeculationStats, Speculator, StubRecognizer
+from tenants import RateLimiter
+
+REPLY_DELAY = 0.2
+
+class FakeClient:
+    """Stands in for GeminiLiveClient, answering each question after REPLY_DELAY"""
+
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    async def stream_text_message(self, text: str):
+        self.calls.append(text)
+        await asyncio.sleep(REPLY_DELAY)
+        yield f"answer to {text.strip()}"
+
+    async def send_text_message(self, text: str):
+        async for chunk in self.stream_text_message(text):
+            yield chunk
+
+    async def send_audio_message(self, audio_data: bytes, mime_type: str = "audio/webm"):
+        self.calls.append(audio_data)
+        yield "answer to audio"
+
+    def fork(self):
+        return FakeClient(self.calls)
+
+class TimingOutClient(FakeClient):
+    """Fails every request the way a first-token timeout does"""
+
+    async def stream_text_message(self, text: str):
+        self.calls.append(text)
+        raise asyncio.TimeoutError("No response from model within 15s")
+        yield
+
+class FlakyClient(FakeClient):
+    """Answers normally, but its forks time out"""
+
+    def fork(self):
+        return TimingOutClient(self.calls)
+
+class TrailingRecognizer(StubRecognizer):
+    """Hears one more word at the end of the utterance than in the partial transcript"""
+
+    def finish(self) -> str:
+        return super().finish() + " today"
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(Config, "SPECULATION_STABLE_CHUNKS", 2)
+    monkeypatch.setattr(Config, "SPECULATION_MIN_WORDS", 3)
+    monkeypatch.setattr(speculation, "stats", SpeculationStats())
+
+async def utterance(speculator: Speculator, *parts: str, pause: float = 0.0) -> list:
+    """Feed each part as an audio chunk, wait, then end the utterance and collect the reply"""
+    for part in parts:
+        await speculator.feed(part.encode())
+    await asyncio.sleep(pause)
+    return [chunk async for chunk in speculator.finish()]
+
+def test_hit_uses_speculative_reply():
+    async def run():
+        calls = []
+        client = FakeClient(calls)
+        speculator = Speculator(client, StubRecognizer(), "test")
+        reply = await utterance(speculator, "what is the rv400 price", " ", " ", pause=0.3)
+        return reply, calls, speculator.client is not client
+
+    reply, calls, switched = asyncio.run(run())
+    assert reply == ["answer to what is the rv400 price"]
+    assert len(calls) == 1
+    assert switched
+    assert speculation.stats.hits == 1 and speculation.stats.misses == 0
+
+def test_saved_is_the_upstream_wait_avoided():
+    async def run():
+        speculator = Speculator(FakeClient([]), StubRecognizer(), "test")
+        await utterance(speculator, "what is the rv400 price", " ", " ", pause=0.3)
+
+    asyncio.run(run())
+    # The reply was ready before the utterance ended, so nearly all of REPLY_DELAY was saved
+    saved = speculation.stats.saved[0]
+    assert abs(saved - REPLY_DELAY) < 0.05
+
+def test_miss_answers_final_transcript():
+    async def run():
+        calls = []
+        speculator = Speculator(FakeClient(calls), TrailingRecognizer(), "test")
+        reply = await utterance(speculator, "what is the rv400 price", " ", " ")
+        return reply, calls
+
+    reply, calls = asyncio.run(run())
+    assert reply == ["answer to what is the rv400 price   today"]
+    assert calls == ["what is the rv400 price  ", "what is the rv400 price   today"]
+    assert speculation.stats.misses == 1 and speculation.stats.hits == 0
+
+def test_changed_transcript_restarts_speculation():
+    async def run():
+        calls = []
+        speculator = Speculator(FakeClient(calls), StubRecognizer(), "test")
+        reply = await utterance(speculator, "what is the", " ", " ", " rv400 price", " ", " ", pause=0.3)
+        return reply, calls
+
+    reply, calls = asyncio.run(run())
+    assert reply == ["answer to what is the   rv400 price"]
+    assert len(calls) == 2
+    assert speculation.stats.restarts == 1 and speculation.stats.hits == 1
+
+def test_speculation_is_rate_limited():
+    async def run():
+        calls = []
+        speculator = Speculator(FakeClient(calls), StubRecognizer(), "test", RateLimiter(1))
+        reply = await utterance(speculator, "what is the", " ", " ", " rv400 price", " ", " ")
+        return reply, calls
+
+    reply, calls = asyncio.run(run())
+    # The restarted speculation found no tokens left, so only the final transcript was answered
+    assert reply == ["answer to what is the   rv400 price"]
+    assert calls == ["what is the  ", "what is the   rv400 price  "]
+    assert speculation.stats.hits == 0
+
+def test_reset_drops_the_utterance():
+    async def run():
+        calls = []
+        speculator = Speculator(FakeClient(calls), StubRecognizer(), "test")
+        for part in ("what is the rv400 price", " ", " "):
+            await speculator.feed(part.encode())
+        await speculator.reset()
+        reply = await utterance(speculator, "book a test ride")
+        return reply, calls, speculator.audio
+
+    reply, calls, audio = asyncio.run(run())
+    assert reply == ["answer to book a test ride"]
+    assert calls[-1] == "book a test ride"
+    assert audio == []
+
+def test_interleaved_turn_discards_speculation():
+    async def run():
+        calls = []
+        client = FakeClient(calls)
+        speculator = Speculator(client, StubRecognizer(), "test")
+        for part in ("what is the rv400 price", " ", " "):
+            await speculator.feed(part.encode())
+        # A text turn on the session while the utterance is still streaming
+        speculator.discard()
+        [chunk async for chunk in client.send_text_message("book a test ride")]
+        reply = await utterance(speculator, " ")
+        return reply, calls, speculator.client is client
+
+    reply, calls, kept_client = asyncio.run(run())
+    assert reply == ["answer to what is the rv400 price"]
+    assert calls[-2:] == ["book a test ride", "what is the rv400 price   "]
+    assert kept_client
+    assert speculation.stats.hits == 0
+
+def test_failed_speculation_is_retried():
+    async def run():
+        calls = []
+        client = FlakyClient(calls)
+        speculator = Speculator(client, StubRecognizer(), "test")
+        reply = await utterance(speculator, "what is the rv400 price", " ", " ", pause=0.05)
+        return reply, calls, speculator.client is client
+
+    reply, calls, kept_client = asyncio.run(run())
+    # The timeout is not served as the answer; the transcript is sent again on the session's client
+    assert reply == ["answer to what is the rv400 price"]
+    assert len(calls) == 2
+    assert kept_client
+    assert speculation.stats.failures == 1 and speculation.stats.hits == 0
+    assert len(speculation.stats.saved) == 0
+
+def test_too_long_utterance_is_dropped(monkeypatch):
+    monkeypatch.setattr(Config, "STREAMED_AUDIO_MAX_BYTES", 40)
+
+    async def run():
+        calls = []
+        speculator = Speculator(FakeClient(calls), StubRecognizer(), "test")
+        await speculator.feed(b"what is the rv400 price")
+        with pytest.raises(ValueError, match="too long"):
+            await speculator.feed(b" and how far does it go on one charge")
+        # The rest of the recording is ignored and nothing is answered for it
+        await speculator.feed(b" please")
+        buffered = speculator.audio_bytes
+        dropped = [chunk async for chunk in speculator.finish()]
+        reply = await utterance(speculator, "book a test ride")
+        return buffered, dropped, reply, calls
+
+    buffered, dropped, reply, calls = asyncio.run(run())
+    assert buffered == 0
+    assert dropped == []
+    assert reply == ["answer to book a test ride"]
+    assert calls == ["book a test ride"]